@@ -2,11 +2,16 @@ import os
 import re
 import time
 import json
+import hashlib
+import shutil
+import threading
 import subprocess
 
 import sublime
 import sublime_plugin
 
+from . import state
+
 stash = {}
 
 def sel(view, i=0):
@@ -60,6 +65,20 @@ def get_goenv(setting = None):
 
 	wd = active_wd()
 
+	project = state.project_key()
+	name = build_profiles.get(project)
+	if name:
+		env = build_profile_envs.get((project, name, wd))
+		if env is not None:
+			return env
+		profile = get_build_profiles(setting).get(name)
+		if profile:
+			env = build_profile_envs[(project, name, wd)] = profile_goenv(wd, senv, profile)
+			return env
+
+	return make_goenv(wd, senv)
+
+def make_goenv(wd, senv):
 	gopath = [os.path.normpath(p) for p in os.environ.get('GOPATH', '').split(os.path.pathsep) if p]
 
 	gsPath = senv.get('GOPATH', '')
@@ -89,6 +108,43 @@ def get_goenv(setting = None):
 
 	return env
 
+def env_overrides(senv):
+	return dict((k, v) for k, v in senv.items() if os.environ.get(k) != v)
+
+build_profiles = {}
+build_profile_envs = {}
+
+def clear_build_profile_envs():
+	build_profile_envs.clear()
+
+def plugin_loaded():
+	get_setting().add_on_change('gohelper_build_profiles', clear_build_profile_envs)
+
+def get_build_profiles(setting=None):
+	if not setting:
+		setting = get_setting()
+	profiles = dict(setting.get('build_profiles', {}))
+	view = active_valid_go_view(strict=False)
+	if view:
+		profiles.update(view.settings().get('gohelper_build_profiles', {}))
+	return profiles
+
+def profile_goenv(wd, senv, profile):
+	penv = dict(senv)
+	for k in ('GOOS', 'GOARCH', 'GOROOT'):
+		if profile.get(k):
+			penv[k] = profile[k]
+	env = make_goenv(wd, penv)
+	if profile.get('GOROOT'):
+		env['GOROOT'] = profile['GOROOT']
+		env['PATH'] = os.path.join(profile['GOROOT'], 'bin') + os.path.pathsep + env.get('PATH', '')
+	tags = profile.get('tags')
+	if tags:
+		if not isinstance(tags, str):
+			tags = ','.join(tags)
+		env['GOFLAGS'] = (env.get('GOFLAGS', '') + ' -tags=' + tags).strip()
+	return env
+
 def get_setting():
 	return sublime.load_settings("GoSublime.sublime-settings")
 
@@ -121,8 +177,10 @@ class EVT(sublime_plugin.EventListener):
 		self.off()
 	def on_selection_modified(self, *args, **kwargs):
 		self.off()
-	def on_activated(self, *args, **kwargs):
+	def on_activated(self, view, *args, **kwargs):
 		self.off()
+		warmup_project(view)
+		restore_build_errors(view)
 	def on_deactivated(self, *args, **kwargs):
 		self.off()
 	def on_text_command(self, view, cmd, *args, **kwargs):
@@ -139,6 +197,7 @@ class EVT(sublime_plugin.EventListener):
 class GoInstallCommand(sublime_plugin.WindowCommand):
 	panel_name = 'output.GoInstall-output'
 	reg_lines = re.compile(r'^(?P<file>[^ ]+\.go):(?P<line>\d+):.*', re.I|re.M)
+	reg_errors = re.compile(r'^(?P<file>[^ ]+\.go):(?P<line>\d+):(?:\d+:)?\s*(?P<msg>.*)', re.I|re.M)
 
 	def run(self, save = True):
 		view = self.window.active_view()
@@ -149,6 +208,8 @@ class GoInstallCommand(sublime_plugin.WindowCommand):
 		if active_valid_go_view(self.window) is None:
 			return
 
+		cancel_warmup()
+
 		from GoSublime.gosubl import gs, mg9
 		from GoSublime.gs9o import active_wd
 
@@ -184,8 +245,22 @@ class GoInstallCommand(sublime_plugin.WindowCommand):
 					f = path.join(wd, f)
 					sublime.set_timeout(lambda: win.open_file('%s:%s' % (f, n), sublime.ENCODED_POSITION), 0)
 
+		project = state.project_key(win)
+
+		def remember(out):
+			errors = []
+			for f, n, msg in self.reg_errors.findall(out):
+				if not os.path.isabs(f):
+					f = os.path.join(wd, f)
+				errors.append([f, int(n), msg])
+			if errors:
+				state.put(project, 'build', wd, errors, set(e[0] for e in errors))
+			else:
+				state.remove(project, 'build', wd)
+
 		def cb(res, err):
 			out = res.get('err', '').strip()
+			sublime.set_timeout(lambda: remember(out), 0)
 			if out:
 				gs.show_output('GoInstall', out, False, gs.tm_path('go'))
 				focus(out)
@@ -194,6 +269,144 @@ class GoInstallCommand(sublime_plugin.WindowCommand):
 					sublime.set_timeout(lambda: win.run_command('hide_panel'), 0)
 		sublime.set_timeout(lambda: mg9.acall('sh', a, cb), 0)
 
+build_errors_restored = set()
+
+def restore_build_errors(view):
+	if not is_go_source_view(view, False):
+		return
+
+	from GoSublime.gs9o import active_wd
+
+	wd = active_wd()
+	if not wd or wd in build_errors_restored:
+		return
+	build_errors_restored.add(wd)
+
+	errors = state.get(state.project_key(view.window()), 'build', wd)
+	if errors:
+		sublime.status_message('GoInstall: %d errors in the last build of %s' % (len(errors), wd))
+
+class GohelperLastBuildErrorsCommand(sublime_plugin.WindowCommand):
+	def run(self):
+		from GoSublime.gs9o import active_wd
+
+		errors = state.get(state.project_key(self.window), 'build', active_wd())
+		if not errors:
+			sublime.status_message('GoInstall: no errors from the last build')
+			return
+
+		items = [['%s:%d' % (os.path.basename(f), n), msg] for f, n, msg in errors]
+
+		def on_done(index):
+			if index < 0:
+				return
+			f, n, msg = errors[index]
+			self.window.open_file('%s:%d' % (f, n), sublime.ENCODED_POSITION)
+
+		self.window.show_quick_panel(items, on_done)
+
+warmup_seen = set()
+warmup_procs = []
+warmup_runs = []
+warmup_lock = threading.Lock()
+
+def warmup_envs(setting):
+	env = get_goenv(setting)
+	envs = [env]
+
+	if setting.get('gohelper_warmup_os_arch', False):
+		def target(e):
+			return [e.get('GOOS', '').lower(), e.get('GOARCH', '').lower()]
+
+		native = env.copy()
+		for k in ('GOOS', 'GOARCH'):
+			if k in os.environ:
+				native[k] = os.environ[k]
+			else:
+				native.pop(k, None)
+
+		selected = env.copy()
+		senv = setting.get('env', {})
+		selected['GOOS'], selected['GOARCH'] = target(senv)
+
+		seen = [target(env)]
+		for extra in (native, selected):
+			t = target(extra)
+			if t in seen or (extra is selected and t not in GO_OS_ARCH):
+				continue
+			seen.append(t)
+			envs.append(extra)
+	return envs
+
+def warmup_project(view):
+	if not is_go_source_view(view, False):
+		return
+
+	setting = get_setting()
+	if not setting.get('gohelper_warmup', False):
+		return
+
+	win = view.window()
+	if not win:
+		return
+
+	folders = win.folders()
+	if folders:
+		root = folders[0]
+		key = state.project_key(win)
+	else:
+		from GoSublime.gs9o import active_wd
+		root = key = active_wd()
+	if not root or key in warmup_seen:
+		return
+	warmup_seen.add(key)
+
+	envs = warmup_envs(setting)
+	nice = shutil.which('nice')
+	cancelled = threading.Event()
+
+	def spawn(args, env):
+		if nice:
+			args = [nice, '-n', '19'] + args
+		with warmup_lock:
+			if cancelled.is_set():
+				return False
+			try:
+				p = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=root, env=env)
+			except OSError as e:
+				print("[GoWarmup]ERROR: " + str(e))
+				return False
+			warmup_procs.append(p)
+		p.wait()
+		with warmup_lock:
+			warmup_procs.remove(p)
+		return not cancelled.is_set()
+
+	def run():
+		print("[GoWarmup]INFO: warming build cache for " + root)
+		for env in envs:
+			if not spawn(['go', 'list', '-deps', './...'], env):
+				break
+			if not spawn(['go', 'build', './...'], env):
+				break
+		with warmup_lock:
+			warmup_runs.remove(cancelled)
+		print("[GoWarmup]INFO: done " + root)
+
+	with warmup_lock:
+		warmup_runs.append(cancelled)
+	threading.Thread(target=run, daemon=True).start()
+
+def cancel_warmup():
+	with warmup_lock:
+		for cancelled in warmup_runs:
+			cancelled.set()
+		for p in warmup_procs:
+			try:
+				p.terminate()
+			except Exception:
+				pass
+
 GO_OS_ARCH = [
 	['darwin', '386'],
 	['darwin', 'amd64'],
@@ -222,14 +435,17 @@ def current_os_arch_index():
 	return -1
 
 def change_os_arch(index):
-	if index > -1 and index < len(GO_OS_ARCH) and index != current_os_arch_index():
+	if index > -1 and index < len(GO_OS_ARCH):
+		build_profiles.pop(state.project_key(), None)
 		goos, goarch = GO_OS_ARCH[index]
 		setting = get_setting()
-		env = get_goenv(setting)
+		senv = setting.get('env', {})
+		env = env_overrides(senv)
 		env['GOOS'] = goos
 		env['GOARCH'] = goarch
-		setting.set('env', env)
-		save_settings()
+		if env != senv:
+			setting.set('env', env)
+			save_settings()
 
 class GoSelectOsArchCommand(sublime_plugin.WindowCommand):
 	def run(self):
@@ -251,76 +467,223 @@ class GoChangeOsArchCommand(sublime_plugin.ApplicationCommand):
 	def run(self, index):
 		change_os_arch(index)
 
-class GohelperGodefCommand(sublime_plugin.WindowCommand):
+class GoSelectBuildProfileCommand(sublime_plugin.WindowCommand):
 	def run(self):
+		profiles = get_build_profiles()
+		self.names = sorted(profiles.keys())
+		if not self.names:
+			sublime.status_message('GoHelper: no build_profiles configured')
+			return
+
+		current = build_profiles.get(state.project_key(self.window))
+		result = [['(settings env)', 'use the env from GoSublime.sublime-settings']]
+		for name in self.names:
+			profile = profiles[name]
+			desc = '%s - %s' % (profile.get('GOOS', ''), profile.get('GOARCH', ''))
+			if profile.get('tags'):
+				desc += ' tags: %s' % profile['tags']
+			if name == current:
+				name += ' (current)'
+			result.append([name, desc])
+		self.window.show_quick_panel(result, self.on_done)
+
+	def on_done(self, index):
+		if index < 0:
+			return
+		key = state.project_key(self.window)
+		if index == 0:
+			build_profiles.pop(key, None)
+			sublime.status_message('GoHelper: build profile cleared')
+		else:
+			name = self.names[index - 1]
+			build_profiles[key] = name
+			for k in [k for k in build_profile_envs if k[:2] == (key, name)]:
+				del build_profile_envs[k]
+			sublime.status_message('GoHelper: build profile ' + name)
+
+def find_godef(setting, env):
+	godef_path = setting.get('godef_path', '')
+	project = state.project_key()
+
+	if not godef_path:
+		godef_path = state.get(project, 'tools', 'godef') or ''
+
+	if not godef_path:
+		paths = env.get('GOPATH', '').split(':')
+		for path in paths:
+			test_path = os.path.join(path, 'bin', 'godef')
+			if not os.path.isfile(test_path):
+				continue
+			print("[Godef]INFO: godef found at" + test_path)
+			godef_path = test_path
+
+		if godef_path:
+			state.put(project, 'tools', 'godef', godef_path, [godef_path])
+
+	if not os.path.isfile(godef_path):
+		print('[Godef]ERROR: godef not found')
+		return None
+	return godef_path
+
+def godef_offsets(view, points):
+	offsets = {}
+	last = 0
+	offset = 0
+	for point in sorted(set(points)):
+		offset += len(view.substr(sublime.Region(last, point)).encode("utf-8"))
+		offsets[point] = offset
+		last = point
+	return offsets
+
+GODEF_STATE_LIMIT = 2000
+
+def godef_key(godef_path, filename, offset, env):
+	ctx = [godef_path] + [env.get(k, '') for k in ('GOOS', 'GOARCH', 'GOROOT', 'GOPATH', 'GOFLAGS')]
+	ctx = hashlib.sha1('\0'.join(ctx).encode('utf-8')).hexdigest()
+	return '%s:%d:%s' % (filename, offset, ctx)
+
+def remember_godef(project, key, filename, postion):
+	state.put(project, 'godef', key, postion, [filename, postion.rsplit(':', 2)[0]], GODEF_STATE_LIMIT)
+
+def godef_lookup(godef_path, filename, offset, env):
+	if not filename:
+		print("[Godef]ERROR: buffer has no file name")
+		return None
+
+	args = [
+		godef_path,
+		"-f",
+		filename,
+		"-o",
+		str(offset)
+	]
+
+	print("[Godef]INFO: spawning: " + " ".join(args))
+
+	try:
+		p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+		output, stderr = p.communicate()
+	except (OSError, ValueError) as e:
+		print("[Godef]ERROR: " + str(e))
+		return None
+	if stderr:
+		print("[Godef]ERROR: no definition found: " + str(stderr))
+		return None
+
+	location = output.decode("utf-8", "replace").rstrip().split(":")
+
+	if len(location) == 3 and location[1].isdigit() and location[2].isdigit():
+		print("[Godef]INFO: godef output: " + str(output))
+		file = location[0]
+		row = int(location[1])
+		col = int(location[2])
+
+		return (file + ":" + str(row) + ":" + str(col))
+
+	print("[Godef]ERROR: godef output bad: " + str(output))
+	return None
+
+class GohelperGodefCommand(sublime_plugin.WindowCommand):
+	def run(self, batch = False):
+		if batch:
+			self.run_batch()
+			return
+
 		print("=================[Godef] Start =================")
 
 		setting = get_setting()
-		godef_path = setting.get('godef_path', '')
 		env = get_goenv(setting)
 
+		godef_path = find_godef(setting, env)
 		if not godef_path:
-			paths = env.get('GOPATH', '').split(':')
-			for path in paths:
-				test_path = os.path.join(path, 'bin', 'godef')
-				if not os.path.isfile(test_path):
-					continue
-				print("[Godef]INFO: godef found at" + test_path)
-				godef_path = test_path
-
-			if godef_path:
-				setting.set('godef_path', godef_path)
-				print('godef save')
-				save_settings()
-
-		if not os.path.isfile(godef_path):
-			print('[Godef]ERROR: godef not found')
 			return
 
 		view = self.window.active_view()
-		select = view.sel()[0]
-		select_begin = select.begin()
-		select_before = sublime.Region(0, select_begin)
-		string_before = view.substr(select_before)
-		string_before.encode("utf-8")
-		buffer_before = bytearray(string_before, encoding = "utf8")
-		offset = len(buffer_before)
+		select_begin = view.sel()[0].begin()
+		offset = godef_offsets(view, [select_begin])[select_begin]
 		print("[Godef]INFO: selcet_begin: " + str(select_begin) + " offset: " + str(offset))
 
 		filename = view.file_name()
+		project = state.project_key(self.window)
+		key = godef_key(godef_path, filename, offset, env)
+		postion = state.get(project, 'godef', key)
+		if not postion:
+			postion = godef_lookup(godef_path, filename, offset, env)
+			if postion:
+				remember_godef(project, key, filename, postion)
+		if postion:
+			print("[Godef]INFO: opening definition at " + postion)
+			view = self.window.open_file(postion, sublime.ENCODED_POSITION)
+			# view.show_at_center(region)
+		print("=================[Godef] End =================")
 
-		args = [
-			godef_path,
-			"-f",
-			filename,
-			"-o",
-			str(offset)
-		]
+	def run_batch(self):
+		setting = get_setting()
+		env = get_goenv(setting)
 
-		print("[Godef]INFO: spawning: " + " ".join(args))
+		godef_path = find_godef(setting, env)
+		if not godef_path:
+			return
 
-		p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-		output, stderr = p.communicate()
-		if stderr:
-			print("[Godef]ERROR: no definition found: " + str(stderr))
-			print("=================[Godef] End =================")
+		view = self.window.active_view()
+		filename = view.file_name()
+		if not filename:
+			sublime.status_message('[Godef] save the file first')
 			return
 
-		location = output.decode("utf-8").rstrip().split(":")
+		words = []
+		for region in view.sel():
+			point = region.begin()
+			word = view.substr(view.word(point)).strip()
+			if (word, point) not in words:
+				words.append((word, point))
+		offsets = godef_offsets(view, [point for word, point in words])
+		workers = max(1, int(setting.get('godef_workers', 4)))
+
+		project = state.project_key(self.window)
+		keys = dict((point, godef_key(godef_path, filename, offsets[point], env)) for word, point in words)
+		cached = dict((point, state.get(project, 'godef', keys[point])) for word, point in words)
+		missing = [point for point, postion in cached.items() if not postion]
+
+		def lookup(point):
+			return godef_lookup(godef_path, filename, offsets[point], env)
+
+		def done(found):
+			items = []
+			for word, point in words:
+				postion = cached[point] or found.get(point)
+				if postion:
+					items.append([word or '?', postion])
+			for point, postion in found.items():
+				if postion:
+					remember_godef(project, keys[point], filename, postion)
+			self.show(view, items)
+
+		def resolve():
+			from concurrent.futures import ThreadPoolExecutor
+
+			with ThreadPoolExecutor(max_workers=workers) as pool:
+				found = dict(zip(missing, pool.map(lookup, missing)))
+			sublime.set_timeout(lambda: done(found), 0)
+
+		sublime.status_message('[Godef] resolving %d selections' % len(words))
+		threading.Thread(target=resolve, daemon=True).start()
+
+	def show(self, view, items):
+		if not items:
+			sublime.status_message('[Godef] no definition found')
+			return
 
-		if len(location) == 3:
-			print("[Godef]INFO: godef output: " + str(output))
-			file = location[0]
-			row = int(location[1])
-			col = int(location[2])
+		def on_done(index):
+			if index < 0:
+				self.window.focus_view(view)
+				return
+			self.window.open_file(items[index][1], sublime.ENCODED_POSITION)
 
-			postion = (file + ":" + str(row) + ":" + str(col))
-			print("[Godef]INFO: opening definition at " + postion)
-			view = self.window.open_file(postion, sublime.ENCODED_POSITION)
-			# view.show_at_center(region)
-		else:
-			print("[Godef]ERROR: godef output bad: " + str(output))
-		print("=================[Godef] End =================")
+		def on_highlight(index):
+			self.window.open_file(items[index][1], sublime.ENCODED_POSITION | sublime.TRANSIENT)
+
+		self.window.show_quick_panel(items, on_done, 0, 0, on_highlight)
 
 
 PLATFORMS = {'linux': 'Linux', 'osx': 'OSX'}
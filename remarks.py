@@ -7,6 +7,10 @@ In order to access the commands you have to add these to your key bindings:
   "args": {"direction": 1} },
 { "keys": ["alt+up"], "command": "highlight_code_remarks_switch",
   "args": {"direction": -1} },
+{ "keys": ["alt+a"], "command": "highlight_code_remarks_agenda" },
+
+SCHEDULED and DEADLINE remarks carrying a date are kept in a per buffer agenda.
+Once their date has passed they are highlighted as OVERDUE.
 
 You might want to override the following parameters within your file settings:
 * highlight_code_remarks_max_file_size
@@ -137,9 +141,17 @@ Add these to your theme (and optionally adapt the colors to your liking):
       in it and trigger the switch.)
 '''
 
+import bisect
+import hashlib
+import heapq
+import re
+import time
+
 import sublime
 import sublime_plugin
 
+from . import state
+
 
 DEFAULT_MAX_FILE_SIZE = 1048576
 DEFAULT_DELAY = 500
@@ -180,6 +192,13 @@ REMARK_QUEUES = (
     )),
 )
 
+DUE_KEYS = ('SCHEDULED', 'DEADLINE')
+DUE_DATE = re.compile(r'(\d+)-(\d+)-(\d+)(?: [^\W\d]+)?(?: (\d+):(\d+))?')
+OVERDUE_TAG = 'HighlightCodeRemarksListener.Overdue'
+OVERDUE_SCOPE = 'remark.warning'
+AGENDA_MAX_DELAY = 3600
+REMARKS_STATE_LIMIT = 500
+
 def view_is_too_big(view, max_size_setting, default_max_size=None):
     settings = view.settings()
     max_size = settings.get(max_size_setting, default_max_size)
@@ -291,15 +310,115 @@ def get_cache():
         )
     return cache
 
+
+def get_cache_hash(cache):
+    '''
+    Returns a short hash of the remark queues so stored scans made with a
+    different configuration are not reused.
+    '''
+    parts = [(title, cache[title]['regex'], cache[title]['mapping'])
+             for title in sorted(cache)]
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:12]
+
 if 'found_regions' not in globals():
     found_regions = dict()
 
+if 'agendas' not in globals():
+    agendas = dict()
+    agenda_timer = dict(due=None, token=0)
+
+
+def parse_due(text):
+    '''
+    Returns the timestamp at which a dated remark becomes overdue. Remarks
+    without a time are due at the end of their day.
+    '''
+    match = DUE_DATE.search(text)
+    if match is None:
+        return None
+    year, month, day, hour, minute = match.groups()
+    try:
+        if hour is None:
+            return time.mktime((int(year), int(month), int(day) + 1,
+                                0, 0, 0, 0, 0, -1))
+        return time.mktime((int(year), int(month), int(day),
+                            int(hour), int(minute), 0, 0, 0, -1))
+    except (OverflowError, ValueError):
+        return None
+
+
+def update_agenda(view):
+    buffer_id = view.buffer_id()
+    entries = []
+    for title, key, value, region in found_regions.get(buffer_id, []):
+        if title != 'Due date' or key not in DUE_KEYS:
+            continue
+        due = parse_due(view.substr(region))
+        if due is not None:
+            entries.append((due, region.begin(), region.end(), key))
+    entries.sort()
+    # Entries are sorted, so the pending tail is already a valid heap.
+    split = bisect.bisect_left(entries, (time.time(),))
+    agenda = dict(
+        view=view,
+        entries=entries,
+        pending=entries[split:],
+        overdue=[sublime.Region(begin, end)
+                 for due, begin, end, key in entries[:split]],
+    )
+    agendas[buffer_id] = agenda
+    view.add_regions(OVERDUE_TAG, agenda['overdue'], OVERDUE_SCOPE, "",
+                     sublime.DRAW_EMPTY)
+    schedule_agenda()
+
+
+def drop_agenda(view):
+    agendas.pop(view.buffer_id(), None)
+    view.erase_regions(OVERDUE_TAG)
+
+
+def schedule_agenda():
+    dues = [agenda['pending'][0][0] for agenda in agendas.values()
+            if agenda['pending']]
+    if not dues:
+        return
+    due = min(dues)
+    if agenda_timer['due'] is not None and agenda_timer['due'] <= due:
+        return
+    agenda_timer['due'] = due
+    agenda_timer['token'] += 1
+    token = agenda_timer['token']
+    delay = min(max(due - time.time(), 0), AGENDA_MAX_DELAY)
+    sublime.set_timeout(lambda: on_agenda_timer(token), int(delay * 1000))
+
+
+def on_agenda_timer(token):
+    if token != agenda_timer['token']:
+        return
+    agenda_timer['due'] = None
+    now = time.time()
+    for buffer_id, agenda in list(agendas.items()):
+        view = agenda['view']
+        if view.window() is None:
+            del agendas[buffer_id]
+            continue
+        pending = agenda['pending']
+        if not pending or pending[0][0] > now:
+            continue
+        while pending and pending[0][0] <= now:
+            due, begin, end, key = heapq.heappop(pending)
+            agenda['overdue'].append(sublime.Region(begin, end))
+        view.add_regions(OVERDUE_TAG, agenda['overdue'], OVERDUE_SCOPE, "",
+                         sublime.DRAW_EMPTY)
+    schedule_agenda()
+
 
 class HighlightCodeRemarksListener(DeferedViewListener):
 
     def __init__(self):
         super(HighlightCodeRemarksListener, self).__init__()
         self.cache = get_cache()
+        self.cache_hash = get_cache_hash(self.cache)
         self.max_size_setting = 'highlight_code_remarks_max_file_size'
         self.default_max_file_size = DEFAULT_MAX_FILE_SIZE
         self.delay = DEFAULT_DELAY
@@ -317,6 +436,7 @@ class HighlightCodeRemarksListener(DeferedViewListener):
                 tag = 'HighlightCodeRemarksListener.%s.%s' % (title,
                                                               color_value)
                 view.erase_regions(tag)
+        drop_agenda(view)
 
     def update_queue(self, view, title, queue):
         buffer_id = view.buffer_id()
@@ -344,6 +464,9 @@ class HighlightCodeRemarksListener(DeferedViewListener):
             results[color_value].append(region)
             found_regions[buffer_id].append((title, color_key, color_value, region))
         # print results
+        self.apply_queue(view, title, queue, results)
+
+    def apply_queue(self, view, title, queue, results):
         for color_value in queue['values']:
             tag = 'HighlightCodeRemarksListener.%s.%s' % (title, color_value)
             if color_value in results:
@@ -353,11 +476,45 @@ class HighlightCodeRemarksListener(DeferedViewListener):
                 # print 'remove', tag
                 view.erase_regions(tag)
 
+    def state_key(self, file_name):
+        return '%s:%s' % (file_name, self.cache_hash)
+
+    def restore(self, view, project, file_name):
+        '''
+        Restores the remarks of an unmodified file from the state store.
+
+        @return: True if the stored scan was still valid.
+        '''
+        entries = state.get(project, 'remarks', self.state_key(file_name))
+        if entries is None:
+            return False
+        buffer_id = view.buffer_id()
+        results = dict()
+        for title, key, value, begin, end in entries:
+            region = sublime.Region(begin, end)
+            results.setdefault(title, dict()).setdefault(value, []).append(region)
+            found_regions[buffer_id].append((title, key, value, region))
+        for title, queue in self.cache.items():
+            self.apply_queue(view, title, queue, results.get(title, dict()))
+        return True
+
     def update(self, view):
         buffer_id = view.buffer_id()
         found_regions[buffer_id] = list()
-        for title, queue in self.cache.items():
-            self.update_queue(view, title, queue)
+        file_name = view.file_name()
+        if view.is_dirty() or not state.in_project(file_name, view.window()):
+            file_name = None
+        project = state.project_key(view.window())
+        if file_name is None or not self.restore(view, project, file_name):
+            for title, queue in self.cache.items():
+                self.update_queue(view, title, queue)
+            if file_name is not None:
+                entries = [(title, key, value, region.begin(), region.end())
+                           for title, key, value, region
+                           in found_regions[buffer_id]]
+                state.put(project, 'remarks', self.state_key(file_name),
+                          entries, [file_name], limit=REMARKS_STATE_LIMIT)
+        update_agenda(view)
 
 
 class HighlightCodeRemarksSwitchCommand(sublime_plugin.TextCommand):
@@ -403,4 +560,33 @@ class HighlightCodeRemarksSwitchCommand(sublime_plugin.TextCommand):
             self.view.erase_regions(tag)
             for region in regions[:]:
                 if region[0] == title:
-                    regions.remove(region)
\ No newline at end of file
+                    regions.remove(region)
+
+
+class HighlightCodeRemarksAgendaCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit):
+        agenda = agendas.get(self.view.buffer_id())
+        if not agenda or not agenda['entries']:
+            sublime.status_message('No dated remarks found.')
+            return
+        now = time.time()
+        entries = agenda['entries']
+        items = []
+        for due, begin, end, key in entries:
+            remark = self.view.substr(sublime.Region(begin, end))
+            if due <= now:
+                remark = 'OVERDUE ' + remark
+            row, col = self.view.rowcol(begin)
+            line = self.view.substr(self.view.line(begin)).strip()
+            items.append([remark, '%d: %s' % (row + 1, line)])
+
+        def on_done(index):
+            if index < 0:
+                return
+            region = sublime.Region(entries[index][1])
+            self.view.sel().clear()
+            self.view.sel().add(region)
+            self.view.show_at_center(region)
+
+        self.view.window().show_quick_panel(items, on_done)
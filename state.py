@@ -0,0 +1,130 @@
+'''
+Small versioned on-disk store for things GoHelper would otherwise have to
+recompute after a restart.
+
+Every project gets one JSON file in the Sublime cache directory. Entries are
+stamped with the mtimes of the files they depend on and are validated lazily
+when they are read; stale entries are dropped. Sections can be capped, in
+which case the oldest entries are evicted. Writes happen off the main thread.
+'''
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import sublime
+
+VERSION = 1
+SAVE_DELAY = 2000
+
+if 'projects' not in globals():
+	projects = {}
+	dirty = set()
+	lock = threading.RLock()
+
+def project_key(win=None):
+	if not win:
+		win = sublime.active_window()
+	if win:
+		fn = win.project_file_name()
+		if fn:
+			return fn
+		folders = win.folders()
+		if folders:
+			return folders[0]
+	return ''
+
+def store_path(project):
+	name = hashlib.sha1(project.encode('utf-8')).hexdigest()
+	return os.path.join(sublime.cache_path(), 'GoHelper', name + '.json')
+
+def in_project(path, win=None):
+	if not win:
+		win = sublime.active_window()
+	if not path or not win:
+		return False
+	for folder in win.folders():
+		if path.startswith(os.path.join(folder, '')):
+			return True
+	return False
+
+def load(project):
+	data = projects.get(project)
+	if data is None:
+		data = {}
+		try:
+			with open(store_path(project), 'r', encoding = 'utf-8') as fh:
+				data = json.load(fh)
+		except (IOError, OSError, ValueError):
+			pass
+		if not isinstance(data, dict) or data.get('version') != VERSION or data.get('project') != project:
+			data = {'version': VERSION, 'project': project}
+		projects[project] = data
+	return data
+
+def stamp(path):
+	try:
+		return os.path.getmtime(path)
+	except OSError:
+		return None
+
+def get(project, section, key):
+	with lock:
+		entries = load(project).get(section, {})
+		entry = entries.get(key)
+		if entry is None:
+			return None
+		for path, mtime in entry['stamps'].items():
+			if mtime is None or stamp(path) != mtime:
+				del entries[key]
+				schedule_save(project)
+				return None
+		return entry['value']
+
+def put(project, section, key, value, paths=(), limit=None):
+	with lock:
+		entries = load(project).setdefault(section, {})
+		entries[key] = {
+			'value': value,
+			'stamps': dict((path, stamp(path)) for path in paths),
+			'time': time.time(),
+		}
+		if limit and len(entries) > limit:
+			# Evict down to three quarters of the limit so this stays rare.
+			old = sorted(entries, key = lambda k: entries[k].get('time', 0))
+			for k in old[:len(entries) - limit * 3 // 4]:
+				del entries[k]
+		schedule_save(project)
+
+def remove(project, section, key):
+	with lock:
+		entries = load(project).get(section, {})
+		if entries.pop(key, None) is not None:
+			schedule_save(project)
+
+def schedule_save(project):
+	with lock:
+		if project in dirty:
+			return
+		dirty.add(project)
+	sublime.set_timeout_async(lambda: save(project), SAVE_DELAY)
+
+def save(project):
+	path = store_path(project)
+	tmp = path + '.tmp'
+	with lock:
+		dirty.discard(project)
+		data = projects.get(project)
+		if data is None:
+			return
+		con = json.dumps(data)
+
+	try:
+		os.makedirs(os.path.dirname(path), exist_ok = True)
+		with open(tmp, 'w', encoding = 'utf-8') as fh:
+			fh.write(con)
+		os.replace(tmp, path)
+	except (IOError, OSError) as e:
+		print('[GoHelper]ERROR: could not save state: ' + str(e))